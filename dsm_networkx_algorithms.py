@@ -2,6 +2,7 @@ __author__ = 'Kyle Benson (kebenson@uci.edu)'
 """Somewhat generic and helpful algorithms that other networkx users
 might benefit from."""
 
+import heapq
 import networkx as nx
 import logging
 log = logging.getLogger(__name__)
@@ -269,6 +270,125 @@ def merge_paths(path1, path2):
     return path1 + path2[1:]
 
 
+def nearest_terminals(G, terminals, weight='weight'):
+    """
+    Runs a single multi-source Dijkstra from all the terminals at once in order to find, for each node in G, its
+    closest terminal, its distance from that terminal, and the node before it on the shortest path from that terminal.
+    :type G: nx.Graph
+    :param terminals: iterable of nodes in G
+    :param weight: edge attribute to use as distance (default=1), or a function f(u, v, edge_data) returning it
+    :return: dicts (nearest, dist, pred) keyed by node; pred[t] is None for each terminal t
+    """
+    weight_func = weight if callable(weight) else (lambda u, v, d: d.get(weight, 1))
+    adj = G.adj
+    nearest = {}
+    dist = {}
+    pred = {}
+    heap = []
+    for t in terminals:
+        if t not in pred:
+            pred[t] = None
+            heapq.heappush(heap, (0, t, t))
+
+    tentative = {t: 0 for t in pred}
+    while heap:
+        d, t, u = heapq.heappop(heap)
+        if u in dist:
+            continue
+        dist[u] = d
+        nearest[u] = t
+        for v, data in adj[u].items():
+            if v in dist:
+                continue
+            vd = d + weight_func(u, v, data)
+            if v not in tentative or vd < tentative[v]:
+                tentative[v] = vd
+                pred[v] = u
+                heapq.heappush(heap, (vd, t, v))
+
+    return nearest, dist, pred
+
+
+def mehlhorn_steiner_tree(G, terminals, weight='weight'):
+    """
+    Returns an approximate minimum Steiner tree of G spanning the terminals using Mehlhorn's 1988 algorithm
+    ('A faster approximation algorithm for the Steiner problem in graphs').  Like Kou et al.'s version used by
+    networkx's steiner_tree, it's a 2-approximation, but rather than building the complete metric closure with
+    one single-source shortest paths computation per terminal, it only needs a single multi-source one (see
+    nearest_terminals()) to build a (sparser) closure graph with the same minimum spanning tree.
+    Running time = O(E + VlogV)
+    :type G: nx.Graph
+    :param terminals: iterable of nodes in G
+    :param weight: edge attribute to use as distance (default=1), or a function f(u, v, edge_data) returning it
+    :rtype: nx.Graph
+    :return: the tree as a subgraph of G (NOTE: it's an edge-induced subgraph view so copy it if you need to modify it!)
+    """
+    weight_func = weight if callable(weight) else (lambda u, v, d: d.get(weight, 1))
+    terminals = set(terminals)
+    nearest, dist, pred = nearest_terminals(G, terminals, weight_func)
+
+    # Build the closure graph: each edge crossing between two terminals' Voronoi regions gives a path between
+    # those terminals, of which we keep only the shortest.
+    closure_edges = {}
+    for u, v, data in G.edges(data=True):
+        if u not in dist or v not in dist:
+            continue  # unreachable from any terminal
+        tu, tv = nearest[u], nearest[v]
+        if tu == tv:
+            continue
+        # undirected so we need to check both orderings
+        if (tv, tu) in closure_edges:
+            tu, tv = tv, tu
+        d = dist[u] + weight_func(u, v, data) + dist[v]
+        if (tu, tv) not in closure_edges or d < closure_edges[(tu, tv)][0]:
+            closure_edges[(tu, tv)] = (d, u, v)
+    closure = nx.Graph()
+    closure.add_nodes_from(terminals)
+    closure.add_edges_from((tu, tv, {'weight': d, 'bridge': (u, v)}) for (tu, tv), (d, u, v) in closure_edges.items())
+
+    # Expand the closure's MST into the actual shortest paths it represents
+    edges = set()
+    for _, _, data in nx.minimum_spanning_edges(closure, weight='weight', data=True):
+        u, v = data['bridge']
+        edges.add((u, v))
+        for n in (u, v):
+            while pred[n] is not None:
+                edges.add((pred[n], n))
+                n = pred[n]
+
+    # The expanded paths may overlap and so form cycles: an MST of them with any non-terminal leaves
+    # trimmed off gives us our final tree.
+    subgraph = nx.Graph()
+    subgraph.add_nodes_from(terminals & set(dist))
+    subgraph.add_edges_from((u, v, {'weight': weight_func(u, v, G[u][v])}) for u, v in edges)
+    tree = nx.Graph(nx.minimum_spanning_edges(subgraph, weight='weight', data=False))
+    tree.add_nodes_from(subgraph)
+    trim_non_terminal_leaves(tree, terminals)
+
+    return G.edge_subgraph(tree.edges())
+
+
+def trim_non_terminal_leaves(tree, terminals):
+    """
+    Repeatedly removes (in place) the leaves of tree that aren't terminals until none are left.
+    Only the neighbors of a removed leaf can become new leaves, so we keep a queue of them rather
+    than re-scanning the whole tree after each round: O(V+E) in total.
+    :param tree: a (mutable) tree/forest
+    :type tree: nx.Graph
+    :param terminals: the nodes that must be kept even if they're leaves
+    :return: the list of removed nodes
+    """
+    leaves = [n for n in tree if tree.degree(n) == 1 and n not in terminals]
+    removed = []
+    while leaves:
+        n = leaves.pop()
+        neighbors = list(tree.neighbors(n))
+        tree.remove_node(n)
+        removed.append(n)
+        leaves.extend(m for m in neighbors if tree.degree(m) == 1 and m not in terminals)
+    return removed
+
+
 def get_edges_for_path(p):
     """
     Returns the edges in path p using zip
@@ -296,6 +416,31 @@ if __name__ == '__main__':
     assert not path_exists(g, [0, 5])
     assert not path_exists(g, [100, 101])
 
+    ### Test our Steiner tree approximation: it should give actual Steiner trees within the
+    ### 2-approximation bound of networkx's (Kou et al.) version on weighted graphs
+    print 'testing mehlhorn_steiner_tree against networkx steiner_tree...'
+    import random
+    from networkx.algorithms.approximation import steiner_tree
+    random.seed(7)
+    for i in range(50):
+        sg = nx.connected_watts_strogatz_graph(30, 4, 0.3, seed=i)
+        for u, v, data in sg.edges(data=True):
+            data['weight'] = random.uniform(1, 10)
+        terminals = random.sample(list(sg.nodes()), random.randint(2, 10))
+
+        st = mehlhorn_steiner_tree(sg, terminals)
+        assert nx.is_tree(st), "mehlhorn_steiner_tree returned a non-tree!"
+        assert all(t in st for t in terminals), "mehlhorn_steiner_tree doesn't span all the terminals!"
+        assert not any(st.degree(n) == 1 and n not in terminals for n in st), "Steiner tree has non-terminal leaves!"
+        assert st.size(weight='weight') <= 2 * steiner_tree(sg, terminals).size(weight='weight'),\
+            "mehlhorn_steiner_tree's cost is more than twice that of networkx's steiner_tree!"
+
+    # trimming leaves should cascade up a path of non-terminals but stop at terminals
+    tg = nx.path_graph(5)
+    tg.add_edge(2, 5)
+    assert sorted(trim_non_terminal_leaves(tg, {0, 2})) == [3, 4, 5]
+    assert sorted(tg.nodes()) == [0, 1, 2]
+
     ### Now test disjoint path algorithms
     print 'test disjoint path algorithms via manual visual inspection...'
 
@@ -168,6 +168,20 @@ class SmartCampusExperiment(object):
 
         return arg_parser
 
+    @classmethod
+    def get_default_args(cls):
+        """
+        Returns the default values of all this class's command line arguments.  These are parsed only once per class
+        and then cached since building the whole ArgumentParser (and its parents) is relatively expensive, especially
+        when generating many experiment configurations.
+        NOTE: don't modify the returned object as it's shared!
+        :return argparse.Namespace defaults:
+        """
+        # check the class's own __dict__ so that subclasses with additional arguments get their own defaults
+        if '_default_args' not in cls.__dict__:
+            cls._default_args = cls.get_arg_parser().parse_args(args=[])
+        return cls._default_args
+
     # ENHANCE: maybe a version that uses the members rather than being classmethod?
     @classmethod
     def build_default_results_file_name(cls, args, dirname='results'):
@@ -181,8 +195,7 @@ class SmartCampusExperiment(object):
         if isinstance(args, argparse.Namespace):
             args = vars(args)
 
-        # Pass empty args to get the default configurations.
-        defaults = cls.get_arg_parser().parse_args(args=[])
+        defaults = cls.get_default_args()
 
         # Extract topology file name
         try:
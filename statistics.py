@@ -9,14 +9,23 @@ import argparse
 import sys
 import os
 import json
+try:
+    # ujson decodes our (possibly very large) results files several times faster, but it's optional
+    import ujson
+except ImportError:
+    ujson = None
+import re
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import pandas as pd
-import parse
 
 from seismic_warning_test.statistics import SeismicStatistics as MininetSeismicStatistics
 from config import VARIED_PARAMETERS
 
 # skip over these metrics when looking for reachability results from heuristics
 AVAILABLE_METRICS = {'run', 'nhops', 'overlap', 'cost'}
+# matches the trailing run# (e.g. '.3') of a networkx results filename with its extension removed
+RUN_SUFFIX_REGEX = re.compile(r'\.\d+$')
 
 def parse_args(args):
 ##################################################################################
@@ -51,6 +60,10 @@ def parse_args(args):
 class SmartCampusExperimentStatistics(object):
     """Parse results and visualize statistics e.g. reachability rate, latency (mininet exps only)."""
 
+    # treatment parameters we group by when averaging over runs.  For the mininet version, we shouldn't average
+    # across all of the sequence #s but rather later manually choose which ones to use for plots.
+    varied_params = frozenset(VARIED_PARAMETERS + ['seq'])
+
     def __init__(self, config):
         super(self.__class__, self).__init__()
         self.dirs = config.dirs
@@ -79,21 +92,60 @@ class SmartCampusExperimentStatistics(object):
 
     def parse_dir(self, dirname):
         log.debug("parsing dir: %s" % dirname)
-        for filename in os.listdir(dirname):
-            filename = os.path.join(dirname, filename)
-            if filename.endswith('.progress') or not os.path.isfile(filename):
-                continue
-            self.parse_file(filename)
-
-    def parse_file(self, fname):
-        log.debug("parsing file: %s" % fname)
-
+        filenames = [os.path.join(dirname, filename) for filename in os.listdir(dirname)]
+        filenames = [f for f in filenames if not f.endswith('.progress') and os.path.isfile(f)]
+        if not filenames:
+            return
+
+        # Reading the files is mostly I/O-bound so we overlap it using a pool of threads, but the actual parsing
+        # accumulates everything into self.stats so we do that serially (and in the original order).
+        # NOTE: we only read one window of files ahead at a time so that we don't end up holding every (possibly
+        # very large) decoded results file in memory at once.
+        nthreads = min(len(filenames), multiprocessing.cpu_count())
+        pool = ThreadPool(nthreads)
+        try:
+            for i in range(0, len(filenames), nthreads):
+                window = filenames[i:i + nthreads]
+                for filename, data in zip(window, pool.map(self.read_file, window)):
+                    if data is not None:
+                        self.parse_file(filename, data=data)
+        finally:
+            pool.close()
+            pool.join()
+
+    def read_file(self, fname):
+        """
+        Reads the JSON-formatted results file.
+        :param fname:
+        :return: the decoded results dict, or None if the file isn't a valid results file
+        """
         with open(fname) as f:
             # this try statement was added because the -d <dir> option didn't work with .progress files
             try:
-                data = json.load(f)
+                if ujson is not None:
+                    # NOTE: ujson's default float decoding is imprecise, which would change the reach/cost stats!
+                    try:
+                        return ujson.load(f, precise_float=True)
+                    # ujson rejects the NaN/Infinity tokens that json.dump writes, so fall back to the stdlib for those
+                    except ValueError:
+                        f.seek(0)
+                return json.load(f)
             except ValueError as e:
                 log.debug("Skipping file %s that raised error: %s" % (fname, e))
+                return None
+
+    def parse_file(self, fname, data=None):
+        """
+        Parses the given results file.
+        :param fname:
+        :param data: the already-read contents of fname (see read_file); if None, we read it here
+        :return: the stats extracted from the results
+        """
+        log.debug("parsing file: %s" % fname)
+
+        if data is None:
+            data = self.read_file(fname)
+            if data is None:
                 return
 
         params = data['params']
@@ -133,10 +185,8 @@ class SmartCampusExperimentStatistics(object):
             exp_params['topo'] = exp_params['topo'][1]
             assert isinstance(exp_params['topo'], basestring)
         # XXX: clear any null params e.g. unspecified random seeds
-        for k,v in exp_params.items():
-            if v is None:
-                log.debug("deleting null parameter: %s" % k)
-                del exp_params[k]
+        # NOTE: build a new dict rather than deleting while iterating, which breaks once items() is a view
+        exp_params = {k: v for k, v in exp_params.items() if v is not None}
 
         if experiment_type == 'mininet':
             # handle additional parameters in mininet version
@@ -207,11 +257,15 @@ class SmartCampusExperimentStatistics(object):
 
         elif experiment_type == 'networkx':
             # just use the file name without .json or other file extensions (i.e. the run# if that's included...) as treatment
-            assert filename.endswith('.json'), "why does results file not end with .json???"
-            treatment = filename[:-len('.json')]
+            root, ext = os.path.splitext(filename)
+            if ext == '.json':
+                treatment = root
+            else:
+                # NOTE: our default result names contain dots (e.g. '..._0.10e') so we can't just trim the last one!
+                log.warning("why does results file %s not end with .json???" % filename)
+                treatment = filename
             # ensure the trailing text is a run# before trimming it!
-            if '.' in treatment and parse.parse('.{:d}', treatment[treatment.rfind('.'):]):
-                treatment = treatment[:treatment.rfind('.')]
+            treatment = RUN_SUFFIX_REGEX.sub('', treatment)
             stats = NetworkxSeismicStatistics(results, treatment=treatment, **exp_params)
 
             # we'll combine all the parsed results into a single data frame
@@ -233,9 +287,7 @@ class SmartCampusExperimentStatistics(object):
         """
         # XXX: need to ensure we have all these parameters available
         cols = set(df.columns.tolist())
-        # For mininet version, we shouldn't average across all of the sequence #s but rather later manually choose
-        # which ones to use for plots.
-        group_params = list(set(VARIED_PARAMETERS + ['seq']).intersection(cols))
+        group_params = list(cls.varied_params.intersection(cols))
 
         return df.groupby(group_params).mean().reset_index().drop('run', axis=1)
 
@@ -286,17 +338,21 @@ class NetworkxSeismicStatistics(object):
             # XXX: unicast/oracle are a weird special case where we treat it as a separate row where ntrees=0,
             # which we need to add as a new row AFTER building the DataFrame since just appending it to a row earlier
             # would have made for different-length indices given to the df constructor!
-            special_row = this_run_data.copy()
-            # TODO: this?
-            # special_row['ntrees'] = 0
+            # NOTE: we collect these rows into their own DataFrame rather than appending each one to this_df, which
+            # would copy it every time; everything then gets concatenated just once at the end.
+            special_rows = []
             for special_treatment in ('unicast', 'oracle'):
+                special_row = this_run_data.copy()
+                # TODO: this?
+                # special_row['ntrees'] = 0
                 special_row['select_policy'] = special_treatment
                 special_row['const_alg'] = special_treatment
                 special_row['reach'] = run[special_treatment]
                 special_row['cost'] = run['cost']['unicast'] if special_treatment == 'unicast' else 0
-                this_df = this_df.append(special_row, ignore_index=True)
+                special_rows.append(special_row)
 
             data_frames.append(this_df)
+            data_frames.append(pd.DataFrame(special_rows, columns=this_df.columns))
 
         self.stats = pd.concat(data_frames, ignore_index=True, copy=False)
         self.stats.reset_index()
@@ -317,8 +373,25 @@ class NetworkxSeismicStatistics(object):
         log.debug("running query: %s" % query_string)
         return self.stats.query(query_string)
 
+    @property
+    def stats(self):
+        """
+        The parsed DataFrame.  Any stats merged in with += are buffered and only concatenated (all at once) when
+        this is next accessed, which avoids re-copying the whole accumulated DataFrame on every merge.
+        :rtype: pd.DataFrame
+        """
+        if self._pending_stats:
+            self._stats = pd.concat([self._stats] + self._pending_stats, ignore_index=True, copy=False)
+            self._pending_stats = []
+        return self._stats
+
+    @stats.setter
+    def stats(self, df):
+        self._stats = df
+        self._pending_stats = []
+
     def __iadd__(self, other):
-        self.stats = pd.concat((self.stats, other.stats), ignore_index=True)
+        self._pending_stats.append(other.stats)
         return self
 
 
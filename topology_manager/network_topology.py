@@ -1,12 +1,37 @@
 import logging as log
 import math
+from collections import deque
 
 import networkx as nx
 import dsm_networkx_algorithms as dsm_algs
 import json
+try:
+    # ujson parses large topology files much faster, but it's optional
+    import ujson
+except ImportError:
+    ujson = None
 from networkx.readwrite import json_graph
 
 
+def best_tree_for_path(path_edges, trees, candidates):
+    """
+    Chooses the tree that has the most edges in common with the given path (ties go to the highest index).
+    This is the inner loop of the 'diverse-paths' multicast trees algorithm, so rather than building each tree's
+    intersection with the path just to take its size we simply count the path's edges that are in the tree.
+    :param path_edges: list of edges (any hashable representation e.g. (u, v) or edge IDs)
+    :param trees: list of sets of edges (same representation as path_edges)
+    :param candidates: indices into trees to choose from
+    :return: index of the chosen tree
+    """
+    best_tree = best_overlap = -1
+    for j in candidates:
+        tree = trees[j]
+        overlap = sum(1 for e in path_edges if e in tree)
+        if overlap > best_overlap or (overlap == best_overlap and j > best_tree):
+            best_tree, best_overlap = j, overlap
+    return best_tree
+
+
 class NetworkTopology(object):
     """Uses networkx graph model and various algorithms to perform
     various networking-related computations such as paths, multicast
@@ -24,9 +49,22 @@ class NetworkTopology(object):
         else:
             self.topo = topo
 
+        # memoized path computations: see get_path_cache()
+        self._path_cache = {}
+        self._path_cache_topo = None
+
     def load_from_file(self, filename):
         with open(filename) as f:
-            data = json.load(f)
+            data = None
+            if ujson is not None:
+                # NOTE: ujson's default float decoding is imprecise, which would change the link latencies we route on!
+                try:
+                    data = ujson.load(f, precise_float=True)
+                # ujson rejects the NaN/Infinity tokens that json.dump writes, so fall back to the stdlib for those
+                except ValueError:
+                    f.seek(0)
+            if data is None:
+                data = json.load(f)
         self.topo = json_graph.node_link_graph(data)
 
 
@@ -47,57 +85,61 @@ class NetworkTopology(object):
                 destinations.append(d)
 
         if algorithm == 'steiner':
-            """Default algorithm implemented by networkx that uses sum of
-            shortest paths 2*D approximation.  Currently not available in
-            latest release of networkx, so see README if this import doesn't work."""
-
-            try:
-                from networkx.algorithms.approximation import steiner_tree
-            except ImportError:
-                raise NotImplementedError("Steiner Tree algorithm not found!  See README")
+            """Default algorithm that uses the 2*D Steiner tree approximation.
+            We use Mehlhorn's version (see dsm_algs.mehlhorn_steiner_tree()) since
+            it only needs a single multi-source shortest paths computation rather
+            than the one per terminal of the metric closure-based version in networkx."""
 
             # we don't care about directionality of the mcast tree here,
             # so we can treat the source as yet another destination
             destinations = destinations + [source]
 
-            # Skip over graph modifications if we only want one tree
+            # Skip over graph modifications if we only want one tree.  We still need to
+            # copy it though as it's a subgraph view sharing the topology's 'graph' object.
+            # NOTE: returning here also skips the sanity checks below, which would raise
+            # errors for an empty tree e.g. when all the destinations are unknown.
             if k == 1:
-                return [steiner_tree(self.topo, destinations)]
-
-            # Naive heuristic: generate a multicast tree, increase the
-            # weights on the edges to discourage them, generate another...
-            # So we need to add a temporary attribute to the edges for
-            # the heuristic to use or else we'd overwrite the weights.
-            # TODO: generalize this residual graph approach?
-
-            for u,v in self.topo.edges():
-                self.topo[u][v]['_temp_mcast_weight'] = self.topo[u][v].get(weight_metric, 1.0)
-            # Disjoint trees heuristic: we have the choice of two penalties that we
-            # add to an edge's weight to prevent it from being chosen next round:
-            # 1) args[0] == 'max' --> the max weight of all edges
-            # 2) args[0] == 'double' --> double the weight of the edge
-            penalty_heuristic = 'max'
-            if heur_args is not None and len(heur_args) >= 1:
-                if heur_args[0] not in ('max', 'double'):
-                    log.warn("Unknown steiner tree edge penalty heuristic (args[0]): %s. Using max instead" % heur_args[0])
-                else:
-                    penalty_heuristic = heur_args[0]
-
-            max_weight = max((e[2]['_temp_mcast_weight'] for e in self.topo.edges(data=True)))
-
-            trees = []
-            for i in range(k):
-                new_tree = steiner_tree(self.topo, destinations, weight='_temp_mcast_weight')
-                for u,v in new_tree.edges():
-                    if penalty_heuristic == 'max':
-                        self.topo[u][v]['_temp_mcast_weight'] += max_weight
-                    else:  # must be double
-                        self.topo[u][v]['_temp_mcast_weight'] *= 2
-                trees.append(new_tree)
-
-            for u,v in self.topo.edges():
-                del self.topo[u][v]['_temp_mcast_weight']
-            results = trees
+                return [nx.Graph(dsm_algs.mehlhorn_steiner_tree(self.topo, destinations, weight=weight_metric))]
+
+            else:
+                # Naive heuristic: generate a multicast tree, increase the
+                # weights on the edges to discourage them, generate another...
+                # So we track these temporary weights separately (keyed by both
+                # directions of each edge) for the heuristic to use or else we'd
+                # overwrite the weights.
+                # TODO: generalize this residual graph approach?
+
+                # NOTE: we find the max weight in this same pass over the edges
+                mcast_weights = {}
+                max_weight = None
+                for u, v, data in self.topo.edges(data=True):
+                    w = mcast_weights[u, v] = mcast_weights[v, u] = data.get(weight_metric, 1.0)
+                    if max_weight is None or w > max_weight:
+                        max_weight = w
+                # Disjoint trees heuristic: we have the choice of two penalties that we
+                # add to an edge's weight to prevent it from being chosen next round:
+                # 1) args[0] == 'max' --> the max weight of all edges
+                # 2) args[0] == 'double' --> double the weight of the edge
+                penalty_heuristic = 'max'
+                if heur_args is not None and len(heur_args) >= 1:
+                    if heur_args[0] not in ('max', 'double'):
+                        log.warn("Unknown steiner tree edge penalty heuristic (args[0]): %s. Using max instead" % heur_args[0])
+                    else:
+                        penalty_heuristic = heur_args[0]
+
+                trees = []
+                for i in range(k):
+                    new_tree = dsm_algs.mehlhorn_steiner_tree(self.topo, destinations,
+                                                              weight=lambda u, v, data: mcast_weights[u, v])
+                    for u,v in new_tree.edges():
+                        if penalty_heuristic == 'max':
+                            w = mcast_weights[u, v] + max_weight
+                        else:  # must be double
+                            w = mcast_weights[u, v] * 2
+                        mcast_weights[u, v] = mcast_weights[v, u] = w
+                    trees.append(new_tree)
+
+                results = trees
 
         elif algorithm == 'diverse-paths':
             """This algorithm builds multiple trees by getting multiple paths
@@ -108,14 +150,19 @@ class NetworkTopology(object):
             create somewhat minimally-sized multicast trees."""
 
             destinations = set(destinations)
-            shortest_paths = nx.shortest_path_length(self.topo, source, weight=weight_metric)
-            shortest_paths = ((l, d) for d, l in shortest_paths if d in destinations)
-            sorted_destinations = sorted(shortest_paths)
+            # one Dijkstra from the source gives us all the lengths; we only need to look up the destinations'
+            # (unreachable ones are skipped)
+            shortest_paths = nx.single_source_dijkstra_path_length(self.topo, source, weight=weight_metric)
+            sorted_destinations = sorted((shortest_paths[d], d) for d in destinations if d in shortest_paths)
 
             # Track trees as sets of edges to make checking overlap faster
             # NOTE: if the path overlaps with the tree in terms of a node
             # but not an edge incident with that node, we have a cycle!
             trees = [set() for i in range(k)]
+            # We intern each edge as a small int ID so the sets hash ints rather than tuples of node names.
+            # Both directions of an edge share an ID so paths traversing it either way still overlap.
+            edge_ids = {}
+            edges_by_id = []
 
             for _, d in sorted_destinations:
                 paths = self.get_redundant_paths(source, d, k)
@@ -123,29 +170,33 @@ class NetworkTopology(object):
                 trees_left = set(range(k))
                 for i, p in enumerate(paths):
                     # Add this path to the tree with most components in common
-                    edges = self.get_edges_for_path(p)
-                    overlaps = ((len(trees[j].intersection(edges)), j) for j in trees_left)
-                    best_tree = max(overlaps)[1]
+                    edges = []
+                    for e in zip(p, p[1:]):
+                        eid = edge_ids.get(e)
+                        if eid is None:
+                            eid = edge_ids[e] = edge_ids[e[::-1]] = len(edges_by_id)
+                            edges_by_id.append(e)
+                        edges.append(eid)
+                    best_tree = best_tree_for_path(edges, trees, trees_left)
                     trees_left.remove(best_tree)
                     trees[best_tree].update(edges)
 
             # Subgraph the topology with the trees' edges to maintain attributes
-            results = [self.topo.edge_subgraph(t) for t in trees]
+            results = [self.topo.edge_subgraph([edges_by_id[eid] for eid in t]) for t in trees]
             # Sanity check that we're generating actual trees
             for i, t in enumerate(results):
                 # If it isn't a tree for some reason, trim it down until it is
                 # by first getting a spanning tree of it and then trimming off
                 # any leaf nodes that aren't terminals (destinations).
-                if not nx.is_tree(t):
+                # NOTE: every edge is on a path from the source, so t is connected and thus
+                # a tree iff it has exactly |V|-1 edges: no need for nx.is_tree()'s traversal.
+                if t.number_of_nodes() > 0 and t.number_of_edges() >= t.number_of_nodes():
                     log.info("non-tree mcast tree generated!")
-                    new_t = t.edge_subgraph(nx.minimum_spanning_edges(t, data=False, weight=weight_metric))
-                    non_terminal_leaves = [n for n in new_t.nodes() if\
-                                           (new_t.degree(n) == 1 and n not in destinations and n != source)]
-                    while len(non_terminal_leaves) > 0:
-                        log.info("trimming tree leaves: %s" % non_terminal_leaves)
-                        new_t.remove_nodes_from(non_terminal_leaves)
-                        non_terminal_leaves = [n for n in new_t.nodes() if\
-                                               (new_t.degree(n) == 1 and n not in destinations and n != source)]
+                    # NOTE: copy the edge subgraph as newer networkx versions return a read-only view
+                    new_t = t.edge_subgraph(nx.minimum_spanning_edges(t, data=False, weight=weight_metric)).copy()
+                    trimmed = dsm_algs.trim_non_terminal_leaves(new_t, set(destinations) | {source})
+                    if trimmed:
+                        log.info("trimmed tree leaves: %s" % trimmed)
                     results[i] = new_t
 
         elif algorithm == 'red-blue':
@@ -161,24 +212,21 @@ class NetworkTopology(object):
 
             # TODO: determine how to better support k not powers of 2
             if k != (2**int(math.log(k, 2))):
-                log.warn("Requested %d redundant red-blue trees, but we currently only fully support powers of 2 for k!  Slicing off tail end of results..." % k)
+                log.warn("Requested %d redundant red-blue trees, but we currently only fully support powers of 2 for k!  Some trees will be partitioned fewer times than others..." % k)
 
             from redundant_multicast_algorithms import SkeletonList
 
-            # Repeatedly apply the procedure over everything currently in the results,
-            # which doubles the number of maximally disjoint spanning DAGs each time
-            results = [self.topo]
-
-            for i in range(int(math.ceil(math.log(k, 2)))):
-                this_round = []
-                for t in results:
-                    sl = SkeletonList(t, source)
-                    red_dag = sl.get_red_graph()
-                    blue_dag = sl.get_blue_graph()
-                    this_round.append(red_dag)
-                    this_round.append(blue_dag)
-                results = this_round
-            assert len(results) >= k
+            # Repeatedly apply the procedure to the oldest graph in the results, replacing it with its
+            # red/blue pair, until we have k maximally disjoint spanning DAGs.  For powers of 2 this is
+            # the same as splitting every graph each round, but otherwise we stop as soon as we have
+            # enough rather than doubling all the way to the next power of 2.
+            results = deque([self.topo])
+            while len(results) < k:
+                sl = SkeletonList(results.popleft(), source)
+                results.append(sl.get_red_graph())
+                results.append(sl.get_blue_graph())
+            results = list(results)
+            assert len(results) == k
 
             # Now we need to turn the results into multicast trees
             try:
@@ -188,9 +236,7 @@ class NetworkTopology(object):
 
             assert all(all(d in g for d in destinations) for g in results)
 
-            # Slice off unrequested results, and then convert to undirected
-            # graphs
-            results = results[:k]
+            # Convert to undirected graphs
             results = [steiner_tree(t, destinations, root=source, weight=weight_metric).to_undirected() for t in results]
             assert not any(r.is_directed() for r in results)
 
@@ -202,10 +248,15 @@ class NetworkTopology(object):
         else:
             raise ValueError("Unkown multicast tree generation algorithm %s" % algorithm)
 
-        # Finally, we need to make a new graph copy for each of the trees since we used
-        # subgraph to build them, which means they share the same 'graph' object, which
-        # means they will overwrite each other's attributes when doing e.g. g.graph['address'] = ip_addr
-        results = [nx.Graph(t) for t in results]
+        # Finally, we need to make a new graph copy for each of the trees built using
+        # subgraph since they share the same 'graph' object, which means they will overwrite
+        # each other's attributes when doing e.g. g.graph['address'] = ip_addr
+        # NOTE: newer networkx versions return read-only views for subgraphs, so those need
+        # copying too, as do any directed trees. Trees that are already their own
+        # undirected Graph (e.g. red-blue's, or trimmed diverse-paths ones) are kept as-is.
+        results = [nx.Graph(t) if (t.graph is self.topo.graph or nx.is_frozen(t) or
+                                   t.is_directed() or t.is_multigraph()) else t
+                   for t in results]
 
         # Some sanity checks to verify that they're all trees and all subscribers are reachable from the root (connected)
         if __debug__:
@@ -224,7 +275,7 @@ class NetworkTopology(object):
         """Uses networkx algorithms to build a multicast tree for the given source node and
         destinations (an iterable).  Can be used to build and install flow rules.
         Current implementation simply calls to get_redundant_multicast_trees(k=1)
-        Default algorithm uses the metric closure-based approximation of a steiner tree."""
+        Default algorithm uses Mehlhorn's 2*D approximation of a steiner tree."""
 
         return self.get_redundant_multicast_trees(source, destinations, 1, algorithm)[0]
 
@@ -239,7 +290,15 @@ class NetworkTopology(object):
         This implementation assumes we only care about min-sum costs of edges then nodes
         for the constraints. Running time = O(k(E+VlogV))"""
 
-        return dsm_algs.get_redundant_paths(self.topo, source, destination, k)
+        cache = self.get_path_cache()
+        if cache is None:
+            return dsm_algs.get_redundant_paths(self.topo, source, destination, k)
+
+        key = ('redundant_paths', source, destination, k)
+        paths = cache.get(key)
+        if paths is None:
+            paths = cache[key] = dsm_algs.get_redundant_paths(self.topo, source, destination, k)
+        return [list(p) for p in paths]
 
     def get_multi_source_disjoint_paths(self, sources, target, weight='weight'):
         """Returns disjoint (possibly shortest) paths from each source to the target."""
@@ -249,7 +308,30 @@ class NetworkTopology(object):
         """Gets shortest path by the optionally specified weight attribute between the nodes.
         @:return a sequence of nodes representing the shortest path"""
 
-        return nx.shortest_path(self.topo, source=source, target=destination, weight=weight)
+        cache = self.get_path_cache()
+        if cache is None:
+            return nx.shortest_path(self.topo, source=source, target=destination, weight=weight)
+
+        key = ('path', source, destination, weight)
+        path = cache.get(key)
+        if path is None:
+            path = cache[key] = nx.shortest_path(self.topo, source=source, target=destination, weight=weight)
+        return list(path)
+
+    def get_path_cache(self):
+        """
+        Returns the dict used to memoize path computations (e.g. get_path()) for the current topology, or None if
+        they can't currently be cached.  Since nothing tells us when the topology changes, we only cache paths for
+        frozen topologies (e.g. as in the networkx experiments) and discard them if self.topo gets replaced.
+        NOTE: this assumes you don't modify the weights of a frozen topology's edges!
+        :rtype: dict
+        """
+        if not nx.is_frozen(self.topo):
+            return None
+        if self._path_cache_topo is not self.topo:
+            self._path_cache = {}
+            self._path_cache_topo = self.topo
+        return self._path_cache
 
     @staticmethod
     def merge_paths(path1, path2):
@@ -335,6 +417,54 @@ if __name__ == '__main__':
     except ValueError:
         pass
 
+    # Test the single (k=1) steiner multicast tree wrapper (see dsm_networkx_algorithms for the algorithm's tests):
+    # it should use the requested weight metric and be modifiable without affecting the topology
+    wg = nx.Graph()
+    wg.add_edge('s', 'a', weight=1, latency=5)
+    wg.add_edge('a', 'd', weight=1, latency=5)
+    wg.add_edge('s', 'b', weight=5, latency=1)
+    wg.add_edge('b', 'd', weight=5, latency=1)
+    wnet = NetworkTopology(wg)
+    assert 'a' in wnet.get_multicast_tree('s', ['d']), "steiner multicast tree didn't use the default weight!"
+    tree = wnet.get_redundant_multicast_trees('s', ['d'], 1, weight_metric='latency')[0]
+    assert 'b' in tree and 'a' not in tree, "steiner multicast tree didn't use the requested weight_metric!"
+    tree.graph['address'] = 'test'
+    assert 'address' not in wg.graph, "multicast tree shares its graph attributes with the topology!"
+
+    # Degenerate requests (no destinations, only unknown ones, or just the source) should give an empty tree
+    for degenerate_dests in ([], ['unknown'], [source]):
+        tree = net.get_multicast_tree(source, degenerate_dests)
+        assert tree.number_of_edges() == 0, "degenerate multicast tree request %s gave edges!" % degenerate_dests
+
+    # Test path memoization: only frozen topologies get cached, and the cached paths must not be shared with callers
+    assert net.get_path_cache() is None, "unfrozen topology shouldn't be cached!"
+    net.get_path(source, dest[0])
+    net.get_redundant_paths(source, dest[0])
+    assert not net._path_cache, "paths for an unfrozen topology were cached!"
+
+    frozen_net = NetworkTopology(nx.freeze(nx.Graph(net.topo)))
+    fp = frozen_net.get_path(source, dest[0])
+    expected_fp = list(fp)
+    fp.append('bogus')
+    assert frozen_net.get_path(source, dest[0]) == expected_fp, "modifying a returned path corrupted the path cache!"
+    frps = frozen_net.get_redundant_paths(source, dest[0])
+    expected_frps = [list(p) for p in frps]
+    frps[0].append('bogus')
+    frps.append(['bogus'])
+    assert frozen_net.get_redundant_paths(source, dest[0]) == expected_frps,\
+        "modifying returned redundant paths corrupted the path cache!"
+    assert frozen_net.get_path_cache(), "frozen topology's paths weren't cached!"
+
+    # replacing the topology should drop the cache: remove an edge of the cached path so we can tell
+    assert len(expected_fp) > 2, "path too short to test path cache invalidation!"
+    new_topo = nx.Graph(frozen_net.topo)
+    new_topo.remove_edge(expected_fp[1], expected_fp[2])
+    frozen_net.topo = nx.freeze(new_topo)
+    assert not frozen_net.get_path_cache(), "replacing the topology didn't drop the path cache!"
+    new_fp = frozen_net.get_path(source, dest[0])
+    assert new_fp != expected_fp and all(new_topo.has_edge(u, v) for u, v in net.get_edges_for_path(new_fp)),\
+        "got stale cached path after replacing the topology!"
+
     # Now, test our multicast tree functions
     M = net.get_redundant_multicast_trees(source, dest, ntrees, algorithm)
 
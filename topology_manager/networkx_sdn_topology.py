@@ -3,6 +3,16 @@ import logging as log
 import networkx as nx
 from sdn_topology import SdnTopology
 
+# The first character of a node's name identifies its type in our generated campus topologies (see campus_topo_gen.py)
+HOST_PREFIX = 'h'
+SERVER_PREFIX = 's'
+CLOUD_PREFIX = 'x'
+CLOUD_GATEWAY_PREFIX = 'g'
+# switches within a building (other than its router) e.g. floor switches
+BUILDING_SWITCH_PREFIXES = frozenset('fr')
+NON_BUILDING_SWITCH_PREFIXES = frozenset('cdbmg')
+SWITCH_PREFIXES = BUILDING_SWITCH_PREFIXES | NON_BUILDING_SWITCH_PREFIXES
+
 
 class NetworkxSdnTopology(SdnTopology):
     """Generates a networkx topology (undirected graph) from information
@@ -27,49 +37,41 @@ class NetworkxSdnTopology(SdnTopology):
         return nx.info(self.topo)
 
     def get_servers(self):
-        return [n for n in self.topo.node if self.is_server(n)]
+        return [n for n in self.topo if self.is_server(n)]
 
     def get_clouds(self):
-        return [n for n in self.topo.node if self.is_cloud(n)]
+        return [n for n in self.topo if self.is_cloud(n)]
 
     def get_cloud_gateways(self):
-        return [n for n in self.topo.node if self.is_cloud_gateway(n)]
+        return [n for n in self.topo if self.is_cloud_gateway(n)]
 
     def get_links(self, building_switches=False, attributes=True):
         """Return all links, optionally excluding those within
         a building and optionally including attributes."""
-        if attributes:
-            return [(n1, n2, data) for n1, n2, data in self.topo.edges(data=True) if
-                    (building_switches or self.is_switch(n1, building_switches) or
-                    self.is_switch(n2, building_switches))]
-        else:
-            return [(n1, n2) for n1, n2 in self.topo.edges(data=False) if
-                    (building_switches or self.is_switch(n1, building_switches) or
-                    self.is_switch(n2, building_switches))]
+        links = self.topo.edges(data=attributes)
+        if building_switches:
+            return list(links)
+        # a building's internal links are those with no switch outside the building on either end
+        return [l for l in links if self.is_switch(l[0], False) or self.is_switch(l[1], False)]
 
     def get_switches(self, building_switches=False):
         """Returns all switches, optionally excluding those within
         a building other than the building router."""
-        return [n for n in self.topo.node if self.is_switch(n, building_switches)]
+        return [n for n in self.topo if self.is_switch(n, building_switches)]
 
     def is_server(self, node):
-        return node.startswith('s')
+        return node[0] == SERVER_PREFIX
 
     def is_cloud(self, node):
-        return node.startswith('x')
+        return node[0] == CLOUD_PREFIX
 
     def is_cloud_gateway(self, node):
-        return node.startswith('g')
+        return node[0] == CLOUD_GATEWAY_PREFIX
 
     def is_switch(self, node, include_building_switches=True):
         """Returns true if the node is a switch; false if it is not
         or the node is a switch within a building other than the building router."""
-        non_building_switches = ('c', 'd', 'b', 'm', 'g')
-        if include_building_switches:
-            building_switches = ('f', 'r')
-            return node[0] in building_switches or node[0] in non_building_switches
-        else:
-            return node[0] in non_building_switches
+        return node[0] in (SWITCH_PREFIXES if include_building_switches else NON_BUILDING_SWITCH_PREFIXES)
 
     # Overridden methods
 
@@ -80,13 +82,12 @@ class NetworkxSdnTopology(SdnTopology):
 
     def is_host(self, node):
         """Returns True if the given node is a host, False if it is a switch."""
-        return node.startswith('h')
+        return node[0] == HOST_PREFIX
 
     def get_ip_address(self, host):
         """Gets the IP address associated with the given host in the topology.
-        Currently simply returns the host ID (number)."""
-        ip = self.topo.node[host][1:]
-        return ip
+        Currently simply returns the host ID (number) i.e. its name without the type prefix."""
+        return host[1:]
 
     def get_ports_for_nodes(self, n1, n2):
         """Returns a pair of port numbers (or IDs) corresponding with the link